@@ -0,0 +1,260 @@
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from PyQt5 import QtCore, QtGui
+
+logger = logging.getLogger(__name__)
+
+
+def hamming(a, b):
+    """
+    Get the Hamming distance between two hashes
+
+    :param a: The first hash
+    :param b: The second hash
+    :return: The number of differing bits
+    """
+    return bin(a ^ b).count('1')
+
+
+def dhash(fname, hash_size=8):
+    """
+    Compute the difference hash of an image
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale
+    thumbnail, and each bit records whether a pixel is brighter than
+    its right neighbour
+
+    :param fname: The filename of the image to hash
+    :param hash_size: The number of rows/bits per row in the hash
+    :return: The hash as an int, or None if the image could not be loaded
+    """
+    img = QtGui.QImage(fname)
+
+    if img.isNull():
+        return None
+
+    img = img.convertToFormat(QtGui.QImage.Format_Grayscale8)
+    img = img.scaled(hash_size + 1, hash_size,
+                     aspectRatioMode=QtCore.Qt.IgnoreAspectRatio,
+                     transformMode=QtCore.Qt.SmoothTransformation)
+
+    h = 0
+    for y in range(hash_size):
+        row = [QtGui.qGray(img.pixel(x, y)) for x in range(hash_size + 1)]
+
+        for left, right in zip(row, row[1:]):
+            h = (h << 1) | (left > right)
+
+    return h
+
+
+class BKTree:
+    def __init__(self):
+        """
+        Init an empty BK-tree keyed by Hamming distance
+        """
+        self._root = None
+
+    def add(self, h, item):
+        """
+        Add an item to the tree
+
+        :param h: The hash of the item
+        :param item: The item to store with this hash
+        """
+        node = (h, item, dict())
+
+        if self._root is None:
+            self._root = node
+            return
+
+        current = self._root
+        while True:
+            d = hamming(h, current[0])
+            child = current[2].get(d)
+
+            if child is None:
+                current[2][d] = node
+                return
+
+            current = child
+
+    def search(self, h, radius):
+        """
+        Find all items within radius of a hash
+
+        :param h: The hash to search around
+        :param radius: The maximum Hamming distance to match
+        :return: A list of (distance, item) tuples
+        """
+        matches = list()
+
+        if self._root is None:
+            return matches
+
+        candidates = [self._root]
+        while candidates:
+            node_hash, item, children = candidates.pop()
+            d = hamming(h, node_hash)
+
+            if d <= radius:
+                matches.append((d, item))
+
+            # only subtrees in [d - radius, d + radius] can contain matches
+            for child_d, child in children.items():
+                if d - radius <= child_d <= d + radius:
+                    candidates.append(child)
+
+        return matches
+
+
+class HashCache:
+    def __init__(self, fname):
+        """
+        Init a hash cache backed by a JSON file
+
+        Entries are keyed by image filename and are only valid while
+        the image's mtime and size are unchanged
+
+        :param fname: The name of the file to store hashes in
+        """
+        self._fname = fname
+        self._entries = dict()
+
+        try:
+            with open(self._fname, 'r') as f:
+                self._entries = json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f'could not load existing hashes in {fname}')
+        except OSError:
+            pass
+
+    def get(self, img_fname, mtime, size):
+        """
+        Get the cached hash of an image
+
+        :param img_fname: The image filename
+        :param mtime: The current modification time of the image
+        :param size: The current size of the image in bytes
+        :return: The hash, or None if missing or stale
+        """
+        try:
+            cached_mtime, cached_size, h = self._entries[img_fname]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if cached_mtime != mtime or cached_size != size:
+            return None
+
+        return h
+
+    def set(self, img_fname, mtime, size, h):
+        """
+        Cache the hash of an image
+
+        :param img_fname: The image filename
+        :param mtime: The modification time of the image
+        :param size: The size of the image in bytes
+        :param h: The hash
+        """
+        self._entries[img_fname] = [mtime, size, h]
+
+    def save(self):
+        """
+        Save hashes to self._fname as JSON
+        """
+        with open(self._fname, 'w') as f:
+            json.dump(self._entries, f)
+            f.flush()
+
+
+def group_hashes(hashes, max_distance):
+    """
+    Group items whose hashes are within max_distance of each other
+
+    Items are visited in sorted order; each item not yet grouped becomes
+    the representative of a new group containing every other ungrouped
+    item within max_distance of it
+
+    :param hashes: A dict of item -> hash
+    :param max_distance: The maximum Hamming distance between near-duplicates
+    :return: A list of groups, each a sorted list of items with the representative first
+    """
+    tree = BKTree()
+    for item, h in hashes.items():
+        tree.add(h, item)
+
+    grouped = set()
+    groups = list()
+
+    for item in sorted(hashes):
+        if item in grouped:
+            continue
+
+        members = sorted(m for _, m in tree.search(hashes[item], max_distance) if m not in grouped and m != item)
+        group = [item] + members
+
+        grouped.update(group)
+        groups.append(group)
+
+    return groups
+
+
+def index_images(img_fnames, cache_fname, max_distance=4, max_workers=None):
+    """
+    Hash images and group them into near-duplicates
+
+    Hashes missing from the cache are computed in a process pool and
+    written back to the cache.  Workers are spawned rather than forked,
+    since forking a process with Qt threads running can deadlock
+
+    :param img_fnames: The image filenames to index
+    :param cache_fname: The name of the file to cache hashes in
+    :param max_distance: The maximum Hamming distance between near-duplicates
+    :param max_workers: The maximum number of hashing processes
+    :return: A dict of image filename -> list of filenames in its group
+    """
+    cache = HashCache(cache_fname)
+    hashes = dict()
+    misses = list()
+
+    for img_fname in img_fnames:
+        try:
+            st = os.stat(img_fname)
+        except OSError:
+            logger.warning(f'could not stat {img_fname}')
+            continue
+
+        h = cache.get(img_fname, st.st_mtime, st.st_size)
+
+        if h is None:
+            misses.append((img_fname, st.st_mtime, st.st_size))
+        else:
+            hashes[img_fname] = h
+
+    if misses:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(dhash, [m[0] for m in misses], chunksize=64)
+
+            for (img_fname, mtime, size), h in zip(misses, results):
+                if h is None:
+                    logger.warning(f'could not hash {img_fname}')
+                    continue
+
+                hashes[img_fname] = h
+                cache.set(img_fname, mtime, size, h)
+
+        try:
+            cache.save()
+        except OSError:
+            logger.warning(f'could not save hashes to {cache_fname}')
+
+    groups = dict()
+    for group in group_hashes(hashes, max_distance):
+        for img_fname in group:
+            groups[img_fname] = group
+
+    return groups
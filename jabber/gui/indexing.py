@@ -0,0 +1,38 @@
+import logging
+from jabber.dedup import index_images
+from PyQt5 import QtCore
+
+logger = logging.getLogger(__name__)
+
+
+class _IndexSignals(QtCore.QObject):
+    indexed = QtCore.pyqtSignal(str, object)
+
+
+class IndexTask(QtCore.QRunnable):
+    def __init__(self, img_dir, img_fnames, cache_fname):
+        """
+        Init a task to group near-duplicate images in a thread pool
+
+        :param img_dir: The directory the images were loaded from
+        :param img_fnames: The image filenames to index
+        :param cache_fname: The name of the file to cache hashes in
+        """
+        super(self.__class__, self).__init__()
+        self.signals = _IndexSignals()
+        self._img_dir = img_dir
+        self._img_fnames = img_fnames
+        self._cache_fname = cache_fname
+
+    def run(self):
+        """
+        Index the images and emit the groups, or None if indexing failed
+        """
+        groups = None
+
+        try:
+            groups = index_images(self._img_fnames, self._cache_fname)
+        except Exception:
+            logger.exception(f'could not group images in {self._img_dir}')
+
+        self.signals.indexed.emit(self._img_dir, groups)
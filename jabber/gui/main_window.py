@@ -1,9 +1,12 @@
-import glob
+import bisect
 import logging
 import os
+from jabber import snapshot
 from jabber.gui import MWBase, MWForm
+from jabber.gui.indexing import IndexTask
+from jabber.gui.review import FrameBuffer
 from jabber.label import Labeler
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +19,35 @@ class MainWindow(MWBase, MWForm):
         # images
         self._img_fnames = list()
         self._img_idx = -1
+        self._img_dir = ''
+        self._img_fname_set = set()
+
+        # directory watching
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._rescan_timer = QtCore.QTimer(self)
+        self._rescan_timer.setSingleShot(True)
+        self._rescan_timer.setInterval(200)
+
+        # filenames passing the class filter and the filter's (include, exclude)
+        # classes, or None if not filtering
+        self._visible_fnames = None
+        self._filter_classes = None
+
+        # near-duplicate groups
+        self._groups = dict()
+        self._index_task = None
 
         # labeling
         self._labeler = None
 
+        # review mode
+        self._review_fnames = list()
+        self._review_idx = 0
+        self._frames = FrameBuffer(self)
+        self._review_sync_timer = QtCore.QTimer(self)
+        self._review_sync_timer.setSingleShot(True)
+        self._review_sync_timer.setInterval(150)
+
         # signals
         self._connect_signals()
 
@@ -38,11 +66,20 @@ class MainWindow(MWBase, MWForm):
         """
         self.action_open.triggered.connect(self._get_input_files)
         self.action_set_labels_file.triggered.connect(self._get_labels_fname)
+        self.action_group_duplicates.triggered.connect(self._group_duplicates)
+        self.action_watch_dir.toggled.connect(self._watch_dir)
+        self._watcher.directoryChanged.connect(lambda _: self._rescan_timer.start())
+        self._rescan_timer.timeout.connect(self._rescan_dir)
+        self.action_review.toggled.connect(self._review)
+        self._frames.frame_ready.connect(self._show_review_frame)
+        self.image.frame_resized.connect(self._review_resized)
+        self._review_sync_timer.timeout.connect(self._sync_review)
         self.fname_list.fname_selected.connect(self._jump_to_img)
         self.current_labels.item_deleted.connect(self._delete_label)
         self.classes.item_double_clicked.connect(self._add_label)
         self.classes.item_deleted.connect(self._delete_class)
         self.class_entry.returnPressed.connect(self._add_class_from_entry)
+        self.filter_entry.returnPressed.connect(self._apply_filter)
 
     def _get_input_files(self):
         """
@@ -62,43 +99,231 @@ class MainWindow(MWBase, MWForm):
         # clear existing file list
         self.fname_list.clear()
         self._img_fnames.clear()
+        self._groups.clear()
 
         # enforce trailing slash
         path = os.path.join(path, '')
-
-        # search for known image types
-        for ext in ['jpg', 'jpeg', 'png']:
-            ext = ''.join([f'[{c.lower()}{c.upper()}]' for c in ext])
-            self._img_fnames.extend(glob.glob(f'{path}*.{ext}'))
+        self._img_dir = path
 
         # sort the file names
-        self._img_fnames = sorted(self._img_fnames)
+        self._img_fnames = sorted(self._find_imgs(path))
+        self._img_fname_set = set(self._img_fnames)
         self.fname_list.add_items(self._img_fnames)
+
+        if self._labeler:
+            self._labeler.set_images(self._img_fnames)
+
+        self._apply_filter()
         self._next_img()
 
+        if self.action_review.isChecked():
+            self._review(True)
+
+        # move the watch to the new directory
+        self._watch_dir(self.action_watch_dir.isChecked())
+
+    @staticmethod
+    def _find_imgs(path):
+        """
+        Find image files with known extensions in a directory
+
+        :param path: The directory to search, with a trailing slash
+        :return: A list of image filenames
+        """
+        # search for known image types in one pass, skipping hidden files like glob does
+        with os.scandir(path) as entries:
+            return [f'{path}{e.name}' for e in entries
+                    if not e.name.startswith('.') and os.path.splitext(e.name)[1].lower() in ['.jpg', '.jpeg', '.png']]
+
+    def _watch_dir(self, enabled):
+        """
+        Start or stop watching the image directory for changes
+
+        :param enabled: Flag to watch the current image directory
+        """
+        dirs = self._watcher.directories()
+        if dirs:
+            self._watcher.removePaths(dirs)
+
+        if enabled and self._img_dir:
+            self._watcher.addPath(self._img_dir)
+            self._rescan_dir()
+
+    def _rescan_dir(self):
+        """
+        Pick up images added to or removed from the image directory
+
+        New filenames are inserted into the sorted file list in place and
+        deleted ones are dropped, keeping the current image and labels
+        """
+        if not self._img_dir:
+            return
+
+        found = set(self._find_imgs(self._img_dir))
+        added = sorted(found - self._img_fname_set)
+        removed = self._img_fname_set - found
+
+        if not added and not removed:
+            return
+
+        try:
+            current_fname = self._img_fnames[self._img_idx]
+        except IndexError:
+            current_fname = ''
+
+        reviewing = self.action_review.isChecked()
+
+        # update each sorted list in place, so the cost depends on the number of changes
+        for fname in removed:
+            row = bisect.bisect_left(self._img_fnames, fname)
+            del self._img_fnames[row]
+            self.fname_list.remove_item(row, fname)
+
+            if self._visible_fnames is not None:
+                self._remove_sorted(self._visible_fnames, fname)
+
+            if reviewing:
+                idx = self._remove_sorted(self._review_fnames, fname)
+                if idx is not None and idx < self._review_idx:
+                    self._review_idx -= 1
+
+            # drop it from its near-duplicate group
+            group = self._groups.pop(fname, None)
+            if group:
+                group.remove(fname)
+
+        for fname in added:
+            row = bisect.bisect_left(self._img_fnames, fname)
+            self._img_fnames.insert(row, fname)
+
+            visible = self._visible_fnames is None or self._passes_filter(fname)
+            self.fname_list.insert_item(row, fname, hidden=not visible)
+
+            if visible and self._visible_fnames is not None:
+                bisect.insort(self._visible_fnames, fname)
+
+            if visible and reviewing:
+                idx = bisect.bisect_left(self._review_fnames, fname)
+                self._review_fnames.insert(idx, fname)
+                if idx <= self._review_idx:
+                    self._review_idx += 1
+
+        self._img_fname_set = found
+
+        if self._labeler:
+            self._labeler.remove_images(removed)
+            self._labeler.add_images(added)
+
+        if self._visible_fnames is not None:
+            self._show_filter_status()
+
+        if reviewing:
+            self._frames.invalidate(removed)
+
+            if self._review_fnames:
+                self._review_idx = min(self._review_idx, len(self._review_fnames) - 1)
+                self._review_step(0)
+            else:
+                self.action_review.setChecked(False)
+
+            return
+
+        # keep the current image, or show the one that took its place if it was deleted
+        self._img_idx = bisect.bisect_left(self._img_fnames, current_fname)
+        if current_fname not in found:
+            self._img_idx = min(self._img_idx, len(self._img_fnames) - 1)
+            self._load()
+        else:
+            self.fname_list.set_idx(self._img_idx)
+
+    @staticmethod
+    def _remove_sorted(fnames, fname):
+        """
+        Remove a filename from a sorted list if present
+
+        :param fnames: The sorted list of filenames
+        :param fname: The filename to remove
+        :return: The index it was removed from, or None if not present
+        """
+        idx = bisect.bisect_left(fnames, fname)
+
+        if idx < len(fnames) and fnames[idx] == fname:
+            del fnames[idx]
+            return idx
+
+        return None
+
+    def _group_duplicates(self):
+        """
+        Index the loaded images and group near-duplicates
+        so that labels are applied to a whole group at once
+        """
+        if not self._img_fnames:
+            logger.warning('no images to group')
+            return
+
+        # hash in the background so labeling can go on meanwhile
+        self._index_task = IndexTask(
+            self._img_dir, list(self._img_fnames), os.path.join(self._img_dir, '.jabber-hashes.json'))
+        self._index_task.signals.indexed.connect(self._set_groups)
+        self.action_group_duplicates.setEnabled(False)
+        self.statusbar.showMessage('grouping near-duplicates...')
+        QtCore.QThreadPool.globalInstance().start(self._index_task)
+
+    def _set_groups(self, img_dir, groups):
+        """
+        Use near-duplicate groups found in the background
+
+        :param img_dir: The directory the grouped images were loaded from
+        :param groups: A dict of image filename -> list of filenames in its group, or None if grouping failed
+        """
+        self.action_group_duplicates.setEnabled(True)
+        self._index_task = None
+
+        if groups is None:
+            self.statusbar.showMessage('could not group near-duplicates')
+            return
+
+        # a different directory was opened meanwhile
+        if img_dir != self._img_dir:
+            return
+
+        # drop images deleted meanwhile
+        self._groups.clear()
+        for group in {id(group): group for group in groups.values()}.values():
+            group[:] = [fname for fname in group if fname in self._img_fname_set]
+
+            for fname in group:
+                self._groups[fname] = group
+
+        n_groups = len({id(group) for group in self._groups.values()})
+        self.statusbar.showMessage(f'{len(self._groups)} images in {n_groups} groups')
+
     def _get_labels_fname(self):
         """
         Get a filename to save labels with
         """
-        labels_fname, _ = QtWidgets.QFileDialog.getSaveFileName(
+        labels_fname, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
             self,
             'Select filename to save labels to',
-            filter='json(*.json)',
+            filter=f'json(*.json);;snapshot(*{snapshot.EXTENSION})',
             options=QtWidgets.QFileDialog.DontConfirmOverwrite | QtWidgets.QFileDialog.DontUseNativeDialog)
 
         if not labels_fname:
             logger.warning('no labels filename provided')
             return
 
-        if not labels_fname.lower().endswith('.json'):
-            labels_fname += '.json'
+        if not labels_fname.lower().endswith(('.json', snapshot.EXTENSION)):
+            labels_fname += snapshot.EXTENSION if selected_filter.startswith('snapshot') else '.json'
 
         self._labeler = Labeler(labels_fname)
+        self._labeler.set_images(self._img_fnames)
+        self._apply_filter()
         self._load()
 
     def _add_label(self, label, save=True, refresh_class_list=True):
         """
-        Add a label to the current image
+        Add a label to the current image and any near-duplicates grouped with it
 
         :param label: The label to add
         :param save: Flag to save labels after adding
@@ -111,7 +336,7 @@ class MainWindow(MWBase, MWForm):
         try:
             # add the label
             img_fname = self._img_fnames[self._img_idx]
-            self._labeler.add_label(img_fname, label)
+            changed = self._labeler.add_labels(self._groups.get(img_fname, [img_fname]), label)
 
             if save:
                 self._labeler.save()
@@ -122,6 +347,10 @@ class MainWindow(MWBase, MWForm):
 
             if refresh_class_list:
                 self._refresh_classes()
+
+            if changed:
+                self._refresh_review(changed)
+                self._refresh_filter_status()
         except IndexError:
             pass
 
@@ -159,6 +388,8 @@ class MainWindow(MWBase, MWForm):
             if self._labeler:
                 self._labeler.delete_label(img_fname, label)
                 self._labeler.save()
+                self._refresh_review([img_fname])
+                self._refresh_filter_status()
         except IndexError:
             pass
 
@@ -172,6 +403,73 @@ class MainWindow(MWBase, MWForm):
             self._labeler.delete_class(class_name)
             self._labeler.save()
             self._refresh_classes()
+            self._refresh_filter_status()
+
+    def _apply_filter(self):
+        """
+        Narrow the file list to images matching the class filter
+
+        The filter is a comma separated list of classes; images must have
+        every listed class, and none of the classes prefixed with '!'
+        """
+        terms = [t.strip() for t in self.filter_entry.text().split(',') if t.strip()]
+        include = [t for t in terms if not t.startswith('!')]
+        exclude = [t[1:].strip() for t in terms if t.startswith('!')]
+
+        if not terms or not self._labeler:
+            self._visible_fnames = None
+            self._filter_classes = None
+            self.fname_list.set_visible(None)
+            self.statusbar.clearMessage()
+        else:
+            self._filter(include, exclude)
+
+        # review the newly visible images
+        if self.action_review.isChecked():
+            self._review(True)
+
+    def _filter(self, include, exclude):
+        """
+        Narrow the file list to images with every class in include
+        and no class in exclude
+
+        :param include: Classes that images must all have
+        :param exclude: Classes that images must not have any of
+        """
+        # unlabeled images pass an exclude-only filter
+        matches = set(self._labeler.query(include, exclude, loaded_only=True))
+
+        self._filter_classes = (include, exclude)
+        self._visible_fnames = [fname for fname in self._img_fnames if fname in matches]
+        self.fname_list.set_visible(matches)
+        self._show_filter_status()
+
+    def _passes_filter(self, fname):
+        """
+        Check whether an image passes the current class filter
+
+        :param fname: The image filename
+        :return: True if the image passes
+        """
+        include, exclude = self._filter_classes
+        labels = set(self._labeler.get_labels(fname))
+
+        return labels.issuperset(include) and labels.isdisjoint(exclude)
+
+    def _show_filter_status(self):
+        """
+        Show how many images match the class filter
+        """
+        unlabeled = self._labeler.count_unlabeled()
+        self.statusbar.showMessage(
+            f'{len(self._visible_fnames)} of {len(self._img_fnames)} images match, {unlabeled} unlabeled')
+
+    def _refresh_filter_status(self):
+        """
+        Keep the filter status current after labels change
+        """
+        if self._visible_fnames is not None:
+            self._show_filter_status()
 
     def _refresh_classes(self):
         """
@@ -206,6 +504,10 @@ class MainWindow(MWBase, MWForm):
         """
         Load the next image
         """
+        if self._visible_fnames is not None:
+            self._step_visible(1)
+            return
+
         self._img_idx += 1
 
         # wrap around if necessary
@@ -218,6 +520,10 @@ class MainWindow(MWBase, MWForm):
         """
         Load the previous image
         """
+        if self._visible_fnames is not None:
+            self._step_visible(-1)
+            return
+
         self._img_idx -= 1
 
         # wrap around if necessary
@@ -226,6 +532,138 @@ class MainWindow(MWBase, MWForm):
 
         self._load()
 
+    def _step_visible(self, step):
+        """
+        Load the next or previous image passing the class filter
+
+        :param step: 1 for the next image, -1 for the previous one
+        """
+        if not self._visible_fnames:
+            logger.warning('no images match the filter')
+            return
+
+        try:
+            current_fname = self._img_fnames[self._img_idx]
+        except IndexError:
+            current_fname = ''
+
+        # wrap around if necessary
+        if step > 0:
+            idx = bisect.bisect_right(self._visible_fnames, current_fname) % len(self._visible_fnames)
+        else:
+            idx = bisect.bisect_left(self._visible_fnames, current_fname) - 1
+
+        self._img_idx = bisect.bisect_left(self._img_fnames, self._visible_fnames[idx])
+        self._load()
+
+    def _review(self, enabled):
+        """
+        Enter or leave review mode
+
+        In review mode, navigation shows frames pre-rendered in the
+        background with labels drawn over them, and the rest of the
+        window is only updated once navigation pauses
+
+        :param enabled: Flag to enter review mode
+        """
+        if not enabled:
+            self._review_sync_timer.stop()
+            self._frames.reset(list(), None, self.image.label.size())
+            self._load()
+            return
+
+        fnames = self._img_fnames if self._visible_fnames is None else self._visible_fnames
+
+        if not fnames:
+            logger.warning('no images to review')
+            self.action_review.setChecked(False)
+            return
+
+        self._review_fnames = list(fnames)
+        self._frames.reset(self._review_fnames, self._review_labels, self.image.label.size())
+        self._resync_review()
+
+    def _refresh_review(self, img_fnames):
+        """
+        Re-render review frames of images whose labels changed
+
+        :param img_fnames: The image filenames whose labels changed
+        """
+        if self.action_review.isChecked():
+            self._frames.invalidate(img_fnames)
+            self._resync_review()
+
+    def _review_resized(self):
+        """
+        Re-render review frames to fit the resized image widget
+        """
+        if self.action_review.isChecked():
+            self._review_step(0)
+
+    def _review_labels(self, fname):
+        """
+        Get the labels to draw on a review frame
+
+        :param fname: The image filename
+        :return: The list of labels associated with this image
+        """
+        return self._labeler.get_labels(fname) if self._labeler else list()
+
+    def _resync_review(self):
+        """
+        Move the review cursor to the current image and show its frame
+        """
+        try:
+            current_fname = self._img_fnames[self._img_idx]
+        except IndexError:
+            current_fname = ''
+
+        idx = bisect.bisect_left(self._review_fnames, current_fname)
+        self._review_idx = min(idx, len(self._review_fnames) - 1)
+        self._review_step(0)
+
+    def _review_step(self, step):
+        """
+        Show the next or previous review frame
+
+        :param step: 1 for the next frame, -1 for the previous one, 0 for the current one
+        """
+        if self.image.label.size() != self._frames.size():
+            self._frames.reset(self._review_fnames, self._review_labels, self.image.label.size())
+
+        self._review_idx = (self._review_idx + step) % len(self._review_fnames)
+        fname = self._review_fnames[self._review_idx]
+
+        # keep the index current so labeling applies to the frame on screen
+        self._img_idx = bisect.bisect_left(self._img_fnames, fname)
+
+        self._frames.prefetch(self._review_idx, step or 1)
+        self._show_review_frame(fname)
+        self.statusbar.showMessage(f'review {self._review_idx + 1}/{len(self._review_fnames)}: {fname}')
+        self._review_sync_timer.start()
+
+    def _show_review_frame(self, fname):
+        """
+        Show a review frame if it is the one under the cursor
+
+        :param fname: The filename of the frame's image
+        """
+        if not self.action_review.isChecked() or fname != self._review_fnames[self._review_idx]:
+            return
+
+        frame = self._frames.get(fname)
+
+        if frame is not None:
+            self.image.show_frame(fname, frame)
+
+    def _sync_review(self):
+        """
+        Update the file list and current labels to the image under the review cursor
+        """
+        self.fname_list.set_idx(self._img_idx)
+        self.current_labels.clear()
+        self.current_labels.add_items(self._review_labels(self._review_fnames[self._review_idx]))
+
     def _jump_to_img(self, fname):
         """
         Load/jump to the file fname
@@ -233,7 +671,11 @@ class MainWindow(MWBase, MWForm):
         :param fname: The name of the file to jump to
         """
         self._img_idx = self._img_fnames.index(fname)
-        self._load()
+
+        if self.action_review.isChecked():
+            self._resync_review()
+        else:
+            self._load()
 
     def _label_with_keystrokes(self, keystroke):
         """
@@ -244,11 +686,48 @@ class MainWindow(MWBase, MWForm):
         """
         if self._labeler:
             match = self._labeler.match_class(keystroke)
+            self.statusbar.showMessage(self._labeler.get_keystrokes())
 
+            # adding the label may replace the keystrokes with the filter status
             if match:
                 self._add_label(match)
 
-            self.statusbar.showMessage(self._labeler.get_keystrokes())
+    def _undo(self, redo=False):
+        """
+        Undo or redo the most recent label edit and
+        show the image it affected
+
+        :param redo: Flag to redo instead of undo
+        """
+        if not self._labeler:
+            return
+
+        img_fnames = self._labeler.redo() if redo else self._labeler.undo()
+
+        # nothing to undo, so leave the labels file alone
+        if img_fnames is None:
+            return
+
+        self._labeler.save()
+        self._reset_matching()
+
+        try:
+            current_fname = self._img_fnames[self._img_idx]
+        except IndexError:
+            current_fname = ''
+
+        # jump to the edited image if it isn't the current one
+        if img_fnames and current_fname not in img_fnames and img_fnames[0] in self._img_fname_set:
+            self._img_idx = bisect.bisect_left(self._img_fnames, img_fnames[0])
+
+        self._load()
+
+        # _load replaced any review frame with the plain image
+        if self.action_review.isChecked():
+            self._frames.invalidate(img_fnames)
+            self._resync_review()
+
+        self._refresh_filter_status()
 
     def _reset_matching(self):
         """
@@ -267,7 +746,19 @@ class MainWindow(MWBase, MWForm):
         key = e.key()
         text = e.text()
 
-        if key in [QtCore.Qt.Key_Right, QtCore.Qt.Key_Down, QtCore.Qt.Key_Return]:
+        if self.action_review.isChecked():
+            if key in [QtCore.Qt.Key_Right, QtCore.Qt.Key_Down, QtCore.Qt.Key_Return]:
+                self._review_step(1)
+                return
+            elif key in [QtCore.Qt.Key_Left, QtCore.Qt.Key_Up]:
+                self._review_step(-1)
+                return
+
+        if e.matches(QtGui.QKeySequence.Undo):
+            self._undo()
+        elif e.matches(QtGui.QKeySequence.Redo):
+            self._undo(redo=True)
+        elif key in [QtCore.Qt.Key_Right, QtCore.Qt.Key_Down, QtCore.Qt.Key_Return]:
             self._next_img()
         elif key in [QtCore.Qt.Key_Left, QtCore.Qt.Key_Up]:
             self._prev_img()
@@ -0,0 +1,266 @@
+import logging
+from PyQt5 import QtCore, QtGui
+
+logger = logging.getLogger(__name__)
+
+
+def render_frame(fname, size, labels):
+    """
+    Decode an image, scale it to fit size and draw its labels over it
+
+    Only QImage and QPainter are used, so this is safe to call
+    outside the GUI thread
+
+    :param fname: The filename of the image to render
+    :param size: The QSize to fit the image in
+    :param labels: The labels to draw
+    :return: The rendered QImage, null if the image could not be loaded
+    """
+    img = QtGui.QImage(fname)
+
+    if img.isNull():
+        return img
+
+    img = img.scaled(size, aspectRatioMode=QtCore.Qt.KeepAspectRatio)
+
+    if labels:
+        img = img.convertToFormat(QtGui.QImage.Format_ARGB32_Premultiplied)
+        text = ', '.join(sorted(labels))
+
+        painter = QtGui.QPainter(img)
+        rect = painter.fontMetrics().boundingRect(text).adjusted(-4, -2, 4, 2)
+        rect.moveTopLeft(QtCore.QPoint(0, 0))
+        painter.fillRect(rect, QtGui.QColor(0, 0, 0, 160))
+        painter.setPen(QtCore.Qt.white)
+        painter.drawText(rect, QtCore.Qt.AlignCenter, text)
+        painter.end()
+
+    return img
+
+
+class _RenderSignals(QtCore.QObject):
+    rendered = QtCore.pyqtSignal(int, str, object)
+
+
+class _RenderTask(QtCore.QRunnable):
+    def __init__(self, frames, generation, token, idx, fname, size, labels):
+        """
+        Init a task to render one frame in a thread pool
+
+        :param frames: The FrameBuffer the frame is for
+        :param generation: The generation of the frame buffer when the task was created
+        :param token: The token identifying this render of fname
+        :param idx: The index of the frame
+        :param fname: The filename of the image to render
+        :param size: The QSize to fit the image in
+        :param labels: The labels to draw
+        """
+        super(self.__class__, self).__init__()
+        self._frames = frames
+        self._generation = generation
+        self._token = token
+        self._idx = idx
+        self._fname = fname
+        self._size = size
+        self._labels = labels
+
+    def run(self):
+        """
+        Render the frame, or skip it if the cursor has already moved past it
+        """
+        frame = None
+
+        if self._frames.wanted(self._generation, self._idx):
+            frame = render_frame(self._fname, self._size, self._labels)
+
+        self._frames.signals.rendered.emit(self._token, self._fname, frame)
+
+
+class FrameBuffer(QtCore.QObject):
+    frame_ready = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent, ahead=16, behind=4):
+        """
+        Init a ring buffer of frames rendered in the background
+        around a cursor
+
+        :param parent: The parent QObject
+        :param ahead: The number of frames to render ahead of the cursor
+        :param behind: The number of frames to keep behind the cursor
+        """
+        super(self.__class__, self).__init__(parent)
+        self._ahead = ahead
+        self._behind = behind
+
+        # frames by filename, so they survive images being inserted or removed;
+        # the frame farthest from the cursor is dropped once the ring is full
+        self._frames = dict()
+        self._capacity = ahead + behind + 1
+
+        # filename -> token of the render in flight, so results of dropped renders are ignored
+        self._pending = dict()
+        self._next_token = 0
+
+        self._generation = 0
+        self._cursor = 0
+        self._step = 1
+        self._fnames = list()
+        self._get_labels = None
+        self._size = QtCore.QSize()
+
+        self._pool = QtCore.QThreadPool(self)
+        self.signals = _RenderSignals(self)
+        self.signals.rendered.connect(self._rendered)
+
+    def reset(self, fnames, get_labels, size):
+        """
+        Drop all frames and start rendering a new list of images
+
+        The list is not copied, so images can be inserted into or
+        removed from it in place without a reset
+
+        :param fnames: The image filenames, indexed by frame
+        :param get_labels: A function of filename -> labels to draw on its frame
+        :param size: The QSize to fit frames in
+        """
+        self._pool.clear()
+        self._generation += 1
+        self._frames.clear()
+        self._pending.clear()
+        self._fnames = fnames
+        self._get_labels = get_labels
+        self._size = QtCore.QSize(size)
+
+    def size(self):
+        """
+        Get the size frames are rendered to fit in
+
+        :return: The QSize
+        """
+        return self._size
+
+    def get(self, fname):
+        """
+        Get a rendered frame
+
+        :param fname: The filename of the image
+        :return: The QImage, or None if it has not been rendered yet
+        """
+        return self._frames.get(fname)
+
+    def invalidate(self, fnames):
+        """
+        Drop frames so they are rendered again, e.g. after their labels change
+
+        :param fnames: The filenames of the images
+        """
+        for fname in fnames:
+            # a render in flight may have used the old labels
+            self._pending.pop(fname, None)
+            self._frames.pop(fname, None)
+
+    def wanted(self, generation, idx):
+        """
+        Check whether a frame is still worth rendering
+
+        Called from render threads, so this only reads plain attributes
+
+        :param generation: The generation the frame was requested in
+        :param idx: The index of the frame
+        :return: True if the frame is still within the window around the cursor
+        """
+        n = len(self._fnames)
+
+        if generation != self._generation or not n:
+            return False
+
+        offset = (idx - self._cursor) * self._step
+
+        return offset % n <= self._ahead or -offset % n <= self._behind
+
+    def _window(self):
+        """
+        Get the filenames within the window around the cursor
+
+        :return: A dict of filename -> distance from the cursor
+        """
+        n = len(self._fnames)
+        window = dict()
+
+        if not n:
+            return window
+
+        # farthest first, so a filename appearing twice keeps its shortest distance
+        for distance in range(max(self._ahead, self._behind), -1, -1):
+            if distance <= self._behind:
+                window[self._fnames[(self._cursor - self._step * distance) % n]] = distance
+
+            if distance <= self._ahead:
+                window[self._fnames[(self._cursor + self._step * distance) % n]] = distance
+
+        return window
+
+    def prefetch(self, idx, step):
+        """
+        Move the cursor and render the frames around it
+
+        The frame at the cursor is rendered first, then frames in the
+        direction of travel, then frames behind
+
+        :param idx: The index of the new cursor
+        :param step: 1 if moving forwards, -1 if moving backwards
+        """
+        n = len(self._fnames)
+
+        if not n:
+            return
+
+        self._cursor = idx
+        self._step = step
+        offsets = [0]
+        offsets += [step * i for i in range(1, self._ahead + 1)]
+        offsets += [-step * i for i in range(1, self._behind + 1)]
+
+        for priority, offset in zip(range(len(offsets), 0, -1), offsets):
+            i = (idx + offset) % n
+            fname = self._fnames[i]
+
+            if fname in self._pending or fname in self._frames:
+                continue
+
+            self._next_token += 1
+            self._pending[fname] = self._next_token
+            self._pool.start(_RenderTask(self, self._generation, self._next_token, i, fname, self._size,
+                                         self._get_labels(fname)), priority)
+
+    def _rendered(self, token, fname, frame):
+        """
+        Store a frame rendered in the background
+
+        :param token: The token identifying the render
+        :param fname: The filename of the image
+        :param frame: The rendered QImage, or None if the render was skipped
+        """
+        if self._pending.get(fname) != token:
+            return
+
+        del self._pending[fname]
+
+        if frame is None:
+            return
+
+        if frame.isNull():
+            logger.warning(f'invalid image filename: {fname}')
+
+        self._frames[fname] = frame
+
+        if len(self._frames) > self._capacity:
+            # drop frames outside the window first, then the farthest from the cursor
+            window = self._window()
+            farthest = max(self._frames, key=lambda f: window.get(f, self._capacity))
+            del self._frames[farthest]
+
+            if farthest == fname:
+                return
+
+        self.frame_ready.emit(fname)
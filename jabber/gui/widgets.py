@@ -1,15 +1,18 @@
 import logging
 from jabber import gui as gui
-from PyQt5 import QtCore, QtGui
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 logger = logging.getLogger(__name__)
 
 
 class ImageWidget(gui.ImgBase, gui.ImgForm):
+    frame_resized = QtCore.pyqtSignal()
+
     def __init__(self, parent):
         super(self.__class__, self).__init__(parent)
         self.setupUi(self)
         self._current_fname = ''
+        self._showing_frame = False
 
     def load_img(self, fname):
         """
@@ -30,15 +33,36 @@ class ImageWidget(gui.ImgBase, gui.ImgForm):
         # set the pixmap
         self.label.setPixmap(p)
         self._current_fname = fname
+        self._showing_frame = False
+
+    def show_frame(self, fname, frame):
+        """
+        Show an image that has already been decoded and scaled
+
+        :param fname: The filename of the image
+        :param frame: The QImage to show
+        """
+        if frame.isNull():
+            self.label.clear()
+        else:
+            self.label.setPixmap(QtGui.QPixmap.fromImage(frame))
+
+        self._current_fname = fname
+        self._showing_frame = True
 
     def resizeEvent(self, e):
         """
         Reload the current image when the widget
         is resized to fill the label
 
+        Frames shown with show_frame can't be reloaded here,
+        so frame_resized is emitted for them to be re-rendered
+
         :param e: The event
         """
-        if self._current_fname:
+        if self._showing_frame:
+            self.frame_resized.emit()
+        elif self._current_fname:
             self.load_img(self._current_fname)
 
 
@@ -59,6 +83,48 @@ class ImageListWidget(gui.ImgListBase, gui.ImgListForm):
         """
         self.list.addItems(items)
 
+    def insert_item(self, row, item, hidden=False):
+        """
+        Insert an item into list widget
+
+        :param row: The row to insert the item at, in sorted order
+        :param item: The item to insert
+        :param hidden: Flag to hide the item
+        """
+        list_item = QtWidgets.QListWidgetItem(item)
+        self.list.insertItem(row, list_item)
+        list_item.setHidden(hidden)
+
+    def remove_item(self, row, item):
+        """
+        Remove an item from list widget
+
+        :param row: The row the item is expected at, in sorted order
+        :param item: The item to remove
+        """
+        list_item = self.list.item(row)
+
+        # fall back to searching if the list order differs
+        if list_item is None or list_item.text() != item:
+            matches = self.list.findItems(item, QtCore.Qt.MatchExactly)
+
+            if not matches:
+                return
+
+            row = self.list.row(matches[0])
+
+        self.list.takeItem(row)
+
+    def set_visible(self, items):
+        """
+        Hide every item not in items
+
+        :param items: The set of items to show, or None to show all
+        """
+        for row in range(self.list.count()):
+            item = self.list.item(row)
+            item.setHidden(items is not None and item.text() not in items)
+
     def set_idx(self, idx):
         """
         Highlight the fname at this index
@@ -1,37 +1,129 @@
+import collections
 import json
 import logging
+from jabber import snapshot
 
 logger = logging.getLogger(__name__)
 
 
+try:
+    _popcount = int.bit_count
+except AttributeError:
+    # python < 3.10
+    def _popcount(bitmap):
+        """
+        Count the set bits in a bitmap
+
+        :param bitmap: The bitmap as an int
+        :return: The number of set bits
+        """
+        return bin(bitmap).count('1')
+
+
+def _bitmap(positions):
+    """
+    Build a bitmap with the given bits set
+
+    :param positions: The bit positions to set
+    :return: The bitmap as an int
+    """
+    data = bytearray((max(positions, default=-1) + 8) // 8)
+
+    for pos in positions:
+        data[pos >> 3] |= 1 << (pos & 7)
+
+    return int.from_bytes(data, 'little')
+
+
+def _iter_bits(bitmap):
+    """
+    Iterate over the positions of set bits in a bitmap
+
+    :param bitmap: The bitmap as an int
+    :return: A generator of set bit positions, in ascending order
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+
+    for byte_idx, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield 8 * byte_idx + low.bit_length() - 1
+            byte ^= low
+
+
 class Labeler:
-    def __init__(self, fname):
+    def __init__(self, fname, history_len=1000, strict=False):
         """
         Init labeler
 
+        Existing labels are loaded from either a JSON file or a binary
+        snapshot, detected from the file contents.  New label files are
+        saved as snapshots if fname ends with snapshot.EXTENSION, and as
+        JSON otherwise
+
         :param fname: The name of the file to store labels in
+        :param history_len: The maximum number of edits that can be undone
+        :param strict: Flag to raise if existing labels can't be read, instead of starting empty
         """
         self._fname = fname
+        self._is_snapshot = fname.lower().endswith(snapshot.EXTENSION)
         self._labels = dict()
         self._classes = set()
         self._keystrokes = list()
 
-        try:
-            # load the labels
-            with open(self._fname, 'r') as f:
-                self._labels = json.load(f)
+        # edits as (kind, img_fnames, label, new_class) commands, oldest dropped first
+        self._undo = collections.deque(maxlen=history_len)
+        self._redo = collections.deque(maxlen=history_len)
 
-                # populate the class set and convert label lists to sets
-                for fname, labels in self._labels.items():
-                    if type(labels) == list:
-                        self._labels[fname] = set(labels)
+        # per-class posting bitmaps over image ids, for queries
+        self._ids = dict()
+        self._id_fnames = list()
+        self._postings = dict()
 
-                    self._classes.update(labels)
+        # bitmap of the images currently loaded for labeling
+        self._loaded = 0
+
+        try:
+            # load the labels
+            with open(self._fname, 'rb') as f:
+                self._is_snapshot = snapshot.is_snapshot(f)
+
+                if self._is_snapshot:
+                    self._classes, self._labels, self._id_fnames, self._postings = snapshot.read(f)
+                    self._ids = dict(zip(self._id_fnames, range(len(self._id_fnames))))
+                else:
+                    self._load_json(f)
+        except ValueError:
+            # covers bad JSON, bad UTF-8 and bad snapshots
+            if strict:
+                raise
 
-        except json.JSONDecodeError:
             logger.warning(f'could not load existing labels in {fname}')
+            self._labels = dict()
+            self._classes = set()
         except OSError:
-            pass
+            if strict:
+                raise
+
+    def _load_json(self, f):
+        """
+        Load labels from a JSON file
+
+        :param f: The file to load from
+        """
+        self._labels = json.load(f)
+
+        if type(self._labels) != dict:
+            raise ValueError('labels must be a JSON object')
+
+        # populate the class set and convert label lists to sets
+        for fname, labels in self._labels.items():
+            if type(labels) == list:
+                self._labels[fname] = set(labels)
+
+            self._classes.update(labels)
+
+        self._build_index()
 
     def get_labels(self, img_fname):
         """
@@ -49,6 +141,184 @@ class Labeler:
 
         return labels
 
+    def _id(self, img_fname):
+        """
+        Get the id of an image filename, assigning a new one if needed
+
+        :param img_fname: The image filename
+        :return: The id, used as a bit position in the posting bitmaps
+        """
+        try:
+            return self._ids[img_fname]
+        except KeyError:
+            self._ids[img_fname] = len(self._id_fnames)
+            self._id_fnames.append(img_fname)
+            return self._ids[img_fname]
+
+    def _build_index(self):
+        """
+        Build the class posting bitmaps from scratch
+        """
+        positions = dict()
+
+        for img_fname, labels in self._labels.items():
+            img_id = self._id(img_fname)
+
+            for label in labels:
+                positions.setdefault(label, list()).append(img_id)
+
+        self._postings = {label: _bitmap(ids) for label, ids in positions.items()}
+
+    def _index(self, img_fname, label):
+        """
+        Set the bit for an image in a class posting bitmap
+
+        :param img_fname: The image filename
+        :param label: The label
+        """
+        self._postings[label] = self._postings.get(label, 0) | (1 << self._id(img_fname))
+
+    def _unindex(self, img_fname, label):
+        """
+        Clear the bit for an image in a class posting bitmap
+
+        :param img_fname: The image filename
+        :param label: The label
+        """
+        try:
+            self._postings[label] &= ~(1 << self._ids[img_fname])
+        except KeyError:
+            pass
+
+    def _labeled(self):
+        """
+        Get the bitmap of images with at least one label
+
+        :return: The bitmap
+        """
+        bitmap = 0
+        for posting in self._postings.values():
+            bitmap |= posting
+
+        return bitmap
+
+    def _match(self, include=(), exclude=(), loaded_only=False):
+        """
+        Get the bitmap of images matching a boolean filter
+
+        :param include: Classes that images must all have
+        :param exclude: Classes that images must not have any of
+        :param loaded_only: Flag to match loaded images, including unlabeled ones,
+            instead of labeled images
+        :return: The matching bitmap
+        """
+        if include:
+            bitmap = ~0
+            for class_name in include:
+                bitmap &= self._postings.get(class_name, 0)
+
+            if loaded_only:
+                bitmap &= self._loaded
+        else:
+            bitmap = self._loaded if loaded_only else self._labeled()
+
+        for class_name in exclude:
+            bitmap &= ~self._postings.get(class_name, 0)
+
+        return bitmap
+
+    def _bitmap(self, img_fnames):
+        """
+        Get the bitmap of a list of image filenames
+
+        :param img_fnames: The image filenames
+        :return: The bitmap
+        """
+        return _bitmap([self._id(img_fname) for img_fname in img_fnames])
+
+    def set_images(self, img_fnames):
+        """
+        Set the images currently loaded for labeling
+
+        :param img_fnames: The image filenames
+        """
+        self._loaded = self._bitmap(img_fnames)
+
+    def add_images(self, img_fnames):
+        """
+        Add to the images currently loaded for labeling
+
+        :param img_fnames: The image filenames
+        """
+        self._loaded |= self._bitmap(img_fnames)
+
+    def remove_images(self, img_fnames):
+        """
+        Remove from the images currently loaded for labeling
+
+        :param img_fnames: The image filenames
+        """
+        self._loaded &= ~self._bitmap(img_fnames)
+
+    def query(self, include=(), exclude=(), loaded_only=False):
+        """
+        Find images that have every class in include
+        and no class in exclude
+
+        :param include: Classes that images must all have
+        :param exclude: Classes that images must not have any of
+        :param loaded_only: Flag to search loaded images, including unlabeled ones,
+            instead of labeled images
+        :return: The list of matching image filenames
+        """
+        return [self._id_fnames[i] for i in _iter_bits(self._match(include, exclude, loaded_only))]
+
+    def count(self, include=(), exclude=(), loaded_only=False):
+        """
+        Count images that have every class in include
+        and no class in exclude
+
+        :param include: Classes that images must all have
+        :param exclude: Classes that images must not have any of
+        :param loaded_only: Flag to count loaded images, including unlabeled ones,
+            instead of labeled images
+        :return: The number of matching images
+        """
+        return _popcount(self._match(include, exclude, loaded_only))
+
+    def count_unlabeled(self):
+        """
+        Count loaded images without any labels
+
+        :return: The number of loaded images with no labels
+        """
+        return _popcount(self._loaded & ~self._labeled())
+
+    def class_counts(self):
+        """
+        Count the images labeled with each class
+
+        :return: A dict of class -> number of images
+        """
+        return {class_name: _popcount(self._postings.get(class_name, 0)) for class_name in self._classes}
+
+    def cooccurrence(self):
+        """
+        Count the images labeled with each pair of classes
+
+        :return: A tuple of (sorted class list, matrix) where matrix[i][j] is the
+            number of images labeled with both classes[i] and classes[j]
+        """
+        classes = sorted(self._classes)
+        postings = [self._postings.get(class_name, 0) for class_name in classes]
+        matrix = [[0] * len(classes) for _ in classes]
+
+        for i, a in enumerate(postings):
+            for j in range(i, len(postings)):
+                matrix[i][j] = matrix[j][i] = _popcount(a & postings[j])
+
+        return classes, matrix
+
     def get_classes(self):
         """
         Get all unique classes
@@ -73,20 +343,46 @@ class Labeler:
 
         :param img_fname: The image filename this label is associated with
         :param label: The label
+        :return: The image filenames whose labels changed
+        """
+        return self.add_labels([img_fname], label)
+
+    def add_labels(self, img_fnames, label):
         """
-        if img_fname not in self._labels:
-            self._labels[img_fname] = set()
+        Associate a label with several image filenames at once
 
-        self._labels[img_fname].add(label)
+        :param img_fnames: The image filenames this label is associated with
+        :param label: The label
+        :return: The image filenames whose labels changed
+        """
+        added = list()
+
+        for img_fname in img_fnames:
+            if img_fname not in self._labels:
+                self._labels[img_fname] = set()
+
+            if label not in self._labels[img_fname]:
+                self._labels[img_fname].add(label)
+                self._index(img_fname, label)
+                added.append(img_fname)
+
+        new_class = label not in self._classes
         self._classes.add(label)
 
+        if added or new_class:
+            self._record('add', added, label, new_class)
+
+        return added
+
     def add_class(self, class_name):
         """
         Add a class
 
         :param class_name: The class to add
         """
-        self._classes.add(class_name)
+        if class_name not in self._classes:
+            self._classes.add(class_name)
+            self._record('add', [], class_name, True)
 
     def match_class(self, key):
         """
@@ -143,6 +439,8 @@ class Labeler:
         """
         try:
             self._labels[img_fname].remove(label)
+            self._unindex(img_fname, label)
+            self._record('delete', [img_fname], label, False)
         except (AttributeError, KeyError):
             logger.error(f'could not delete label {label} associated with img {img_fname}')
 
@@ -160,16 +458,107 @@ class Labeler:
                     return
 
             self._classes.remove(class_name)
+            self._record('delete', [], class_name, True)
         except KeyError:
             logger.error(f'could not delete class {class_name}')
 
     def save(self):
         """
-        Save labels to self._fname as JSON
+        Save labels to self._fname, as a binary snapshot
+        or JSON depending on the file's format
+        """
+        if self._is_snapshot:
+            self.save_snapshot(self._fname)
+        else:
+            self.export_json(self._fname)
+
+    def save_snapshot(self, fname):
+        """
+        Save labels to a file as a binary snapshot
+
+        :param fname: The name of the file to save to
+        """
+        with open(fname, 'wb') as f:
+            snapshot.write(f, self._classes, self._labels)
+            f.flush()
+
+    def export_json(self, fname):
+        """
+        Save labels to a file as human-readable JSON
+
+        :param fname: The name of the file to save to
         """
         # convert sets to lists
         labels = {fname: list(s) for fname, s in self._labels.items()}
 
-        with open(self._fname, 'w') as f:
+        with open(fname, 'w') as f:
             json.dump(labels, f, indent=4, sort_keys=True)
             f.flush()
+
+    def _record(self, kind, img_fnames, label, new_class):
+        """
+        Record an edit so it can be undone
+
+        :param kind: 'add' or 'delete'
+        :param img_fnames: The image filenames the label was added to or deleted from
+        :param label: The label
+        :param new_class: Flag for the class itself being added or deleted
+        """
+        self._undo.append((kind, img_fnames, label, new_class))
+        self._redo.clear()
+
+    def _apply(self, kind, img_fnames, label, new_class):
+        """
+        Apply an edit without recording it
+
+        :param kind: 'add' or 'delete'
+        :param img_fnames: The image filenames to add the label to or delete it from
+        :param label: The label
+        :param new_class: Flag to also add or delete the class itself
+        """
+        if kind == 'add':
+            for img_fname in img_fnames:
+                self._labels.setdefault(img_fname, set()).add(label)
+                self._index(img_fname, label)
+
+            if new_class:
+                self._classes.add(label)
+        else:
+            for img_fname in img_fnames:
+                self._labels[img_fname].discard(label)
+                self._unindex(img_fname, label)
+
+            if new_class:
+                self._classes.discard(label)
+
+    def undo(self):
+        """
+        Undo the most recent edit
+
+        :return: The image filenames whose labels changed, or None if there was nothing to undo
+        """
+        try:
+            kind, img_fnames, label, new_class = self._undo.pop()
+        except IndexError:
+            return None
+
+        self._apply('delete' if kind == 'add' else 'add', img_fnames, label, new_class)
+        self._redo.append((kind, img_fnames, label, new_class))
+
+        return img_fnames
+
+    def redo(self):
+        """
+        Redo the most recently undone edit
+
+        :return: The image filenames whose labels changed, or None if there was nothing to redo
+        """
+        try:
+            kind, img_fnames, label, new_class = self._redo.pop()
+        except IndexError:
+            return None
+
+        self._apply(kind, img_fnames, label, new_class)
+        self._undo.append((kind, img_fnames, label, new_class))
+
+        return img_fnames
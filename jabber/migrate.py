@@ -0,0 +1,38 @@
+import argparse
+import logging
+import sys
+from jabber import snapshot
+from jabber.label import Labeler
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(src_fname, dst_fname):
+    """
+    Convert a labels file between JSON and binary snapshot formats
+
+    The source format is detected from its contents, and the destination
+    is written as a snapshot if dst_fname ends with snapshot.EXTENSION,
+    and as JSON otherwise.  Nothing is written if the source can't be read
+
+    :param src_fname: The name of the labels file to convert
+    :param dst_fname: The name of the file to write the converted labels to
+    """
+    labeler = Labeler(src_fname, strict=True)
+
+    if dst_fname.lower().endswith(snapshot.EXTENSION):
+        labeler.save_snapshot(dst_fname)
+    else:
+        labeler.export_json(dst_fname)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a labels file between JSON and binary snapshot formats')
+    parser.add_argument('src', help='labels file to convert')
+    parser.add_argument('dst', help=f'file to write, as a snapshot if it ends with {snapshot.EXTENSION}, JSON otherwise')
+    args = parser.parse_args()
+
+    try:
+        migrate(args.src, args.dst)
+    except (OSError, ValueError) as e:
+        sys.exit(f'could not migrate {args.src}: {e}')
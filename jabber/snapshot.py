@@ -0,0 +1,199 @@
+import array
+import gc
+import struct
+import sys
+
+MAGIC = b'JBLSNAP\0'
+VERSION = 1
+EXTENSION = '.jbl'
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _write_blob(f, data):
+    """
+    Write length-prefixed bytes
+
+    :param f: The binary file to write to
+    :param data: The bytes to write
+    """
+    f.write(struct.pack('<Q', len(data)))
+    f.write(data)
+
+
+def _read_exact(f, n):
+    """
+    Read exactly n bytes
+
+    :param f: The binary file to read from
+    :param n: The number of bytes to read
+    :return: The bytes
+    """
+    data = f.read(n)
+
+    if len(data) != n:
+        raise SnapshotError('truncated snapshot')
+
+    return data
+
+
+def _read_blob(f):
+    """
+    Read length-prefixed bytes
+
+    :param f: The binary file to read from
+    :return: The bytes
+    """
+    n, = struct.unpack('<Q', _read_exact(f, 8))
+    return _read_exact(f, n)
+
+
+def _write_array(f, values):
+    """
+    Write an array of uint32 in little-endian order
+
+    :param f: The binary file to write to
+    :param values: The array('I') to write
+    """
+    if sys.byteorder == 'big':
+        values = array.array('I', values)
+        values.byteswap()
+
+    _write_blob(f, values.tobytes())
+
+
+def _read_array(f):
+    """
+    Read an array of uint32 in little-endian order
+
+    :param f: The binary file to read from
+    :return: The array('I')
+    """
+    values = array.array('I')
+    values.frombytes(_read_blob(f))
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    return values
+
+
+def _split(data, n):
+    """
+    Split a NUL-joined UTF-8 blob into n strings
+
+    :param data: The blob
+    :param n: The number of strings in the blob
+    :return: The list of strings
+    """
+    return data.decode('utf-8').split('\0') if n else list()
+
+
+def is_snapshot(f):
+    """
+    Check whether a binary file is a label snapshot, without moving its position
+
+    :param f: The binary file to check
+    :return: True if the file starts with the snapshot magic bytes
+    """
+    pos = f.tell()
+    magic = f.read(len(MAGIC))
+    f.seek(pos)
+
+    return magic == MAGIC
+
+
+def write(f, classes, labels):
+    """
+    Write labels as a binary snapshot
+
+    The snapshot holds a class table, the image filenames, a table of the
+    distinct label sets, one label set id per image, and one posting
+    bitmap per class (bit i set if image i has that class)
+
+    :param f: The binary file to write to
+    :param classes: The set of all classes
+    :param labels: A dict of image filename -> set of labels
+    """
+    class_list = sorted(set(classes).union(*labels.values()))
+    class_ids = {c: i for i, c in enumerate(class_list)}
+    img_fnames = list(labels)
+
+    # deduplicate label sets, since most images share a few combinations
+    combos = dict()
+    combo_offsets = array.array('I', [0])
+    combo_class_ids = array.array('I')
+    img_combo_ids = array.array('I')
+    postings = [bytearray((len(img_fnames) + 7) // 8) for _ in class_list]
+
+    for img_id, img_fname in enumerate(img_fnames):
+        key = frozenset(labels[img_fname])
+
+        if key not in combos:
+            combos[key] = len(combos)
+            combo_class_ids.extend(sorted(class_ids[c] for c in key))
+            combo_offsets.append(len(combo_class_ids))
+
+        img_combo_ids.append(combos[key])
+
+        for c in key:
+            postings[class_ids[c]][img_id >> 3] |= 1 << (img_id & 7)
+
+    f.write(MAGIC)
+    f.write(struct.pack('<III', VERSION, len(class_list), len(img_fnames)))
+    _write_blob(f, '\0'.join(class_list).encode('utf-8'))
+    _write_blob(f, '\0'.join(img_fnames).encode('utf-8'))
+    _write_array(f, combo_offsets)
+    _write_array(f, combo_class_ids)
+    _write_array(f, img_combo_ids)
+
+    for posting in postings:
+        _write_blob(f, bytes(posting))
+
+
+def read(f):
+    """
+    Read labels from a binary snapshot
+
+    :param f: The binary file to read from
+    :return: A tuple of (set of classes, dict of image filename -> set of labels,
+        list of image filenames in id order, dict of class -> posting bitmap as an int)
+    """
+    if _read_exact(f, len(MAGIC)) != MAGIC:
+        raise SnapshotError('not a label snapshot')
+
+    version, n_classes, n_imgs = struct.unpack('<III', _read_exact(f, 12))
+
+    if version != VERSION:
+        raise SnapshotError(f'unsupported snapshot version {version}')
+
+    class_list = _split(_read_blob(f), n_classes)
+    img_fnames = _split(_read_blob(f), n_imgs)
+    combo_offsets = _read_array(f)
+    combo_class_ids = _read_array(f)
+    img_combo_ids = _read_array(f)
+
+    if len(class_list) != n_classes or len(img_fnames) != n_imgs or len(img_combo_ids) != n_imgs:
+        raise SnapshotError('corrupt snapshot')
+
+    # creating a set per image triggers many pointless cyclic GC passes
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        combos = [tuple(class_list[c] for c in combo_class_ids[start:end])
+                  for start, end in zip(combo_offsets, combo_offsets[1:])]
+
+        # each image gets its own set so labels can be edited independently
+        labels = dict(zip(img_fnames, map(set, map(combos.__getitem__, img_combo_ids))))
+    except IndexError:
+        raise SnapshotError('corrupt snapshot')
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    postings = {c: int.from_bytes(_read_blob(f), 'little') for c in class_list}
+
+    return set(class_list), labels, img_fnames, postings
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from jabber.dedup import BKTree, HashCache, dhash, group_hashes, hamming, index_images
+from PyQt5 import QtGui
+
+
+class DedupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_fname = os.path.join(self.tmp_dir, 'hashes.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _write_img(self, name, ascending=True):
+        img = QtGui.QImage(64, 64, QtGui.QImage.Format_RGB32)
+
+        for x in range(64):
+            for y in range(64):
+                v = 4 * (x if ascending else 63 - x)
+                img.setPixel(x, y, QtGui.qRgb(v, v, v))
+
+        fname = os.path.join(self.tmp_dir, name)
+        img.save(fname)
+        return fname
+
+    def test_hamming_CountsDifferingBits(self):
+        self.assertEqual(hamming(0b1010, 0b1010), 0)
+        self.assertEqual(hamming(0b1010, 0b0101), 4)
+        self.assertEqual(hamming(0, (1 << 64) - 1), 64)
+
+    def test_bkTree_SearchFindsItemsWithinRadius(self):
+        tree = BKTree()
+        hashes = {'a': 0b0000, 'b': 0b0001, 'c': 0b0011, 'd': 0b1111}
+
+        for item, h in hashes.items():
+            tree.add(h, item)
+
+        self.assertEqual(sorted(item for _, item in tree.search(0, 1)), ['a', 'b'])
+        self.assertEqual(sorted(item for _, item in tree.search(0, 2)), ['a', 'b', 'c'])
+        self.assertEqual(tree.search(0b1111, 0), [(0, 'd')])
+
+    def test_bkTree_WithNoItems_GetsEmptyList(self):
+        self.assertEqual(BKTree().search(0, 64), [])
+
+    def test_groupHashes_GroupsNearDuplicates(self):
+        hashes = {'a.jpg': 0b0000, 'b.jpg': 0b0001, 'c.jpg': 0b1111, 'd.jpg': 0b1110}
+
+        groups = group_hashes(hashes, 1)
+
+        self.assertEqual(groups, [['a.jpg', 'b.jpg'], ['c.jpg', 'd.jpg']])
+
+    def test_hashCache_GetsOnlyFreshEntries(self):
+        cache = HashCache(self.cache_fname)
+        cache.set('foo.jpg', 1.0, 10, 42)
+        cache.save()
+
+        cache = HashCache(self.cache_fname)
+        self.assertEqual(cache.get('foo.jpg', 1.0, 10), 42)
+        self.assertIsNone(cache.get('foo.jpg', 2.0, 10))
+        self.assertIsNone(cache.get('foo.jpg', 1.0, 11))
+        self.assertIsNone(cache.get('bar.jpg', 1.0, 10))
+
+    def test_dhash_WithBadFilename_GetsNone(self):
+        self.assertIsNone(dhash(os.path.join(self.tmp_dir, 'missing.png')))
+
+    def test_indexImages_GroupsNearDuplicates(self):
+        a = self._write_img('a.png')
+        b = self._write_img('b.png')
+        c = self._write_img('c.png', ascending=False)
+
+        groups = index_images([a, b, c], self.cache_fname, max_workers=1)
+
+        self.assertEqual(groups[a], [a, b])
+        self.assertIs(groups[a], groups[b])
+        self.assertEqual(groups[c], [c])
+        self.assertTrue(os.path.exists(self.cache_fname))
@@ -1,6 +1,7 @@
 import json
 import os
 import unittest
+from jabber import snapshot
 from jabber.label import Labeler
 
 
@@ -63,6 +64,81 @@ class LabelerTest(unittest.TestCase):
 
         self.assertEqual(self.labeler.get_classes(), classes)
 
+    def test_addLabels_AddsLabelToAllFnames(self):
+        fnames = ['foo.jpg', 'foo1.jpg']
+        self.labeler._labels = {'foo.jpg': {'bar'}}
+
+        self.labeler.add_labels(fnames, 'baz')
+
+        self.assertEqual(self.labeler._labels, {'foo.jpg': {'bar', 'baz'}, 'foo1.jpg': {'baz'}})
+        self.assertEqual(self.labeler.get_classes(), {'baz'})
+
+    def _add_query_labels(self):
+        self.labeler.add_label('a.jpg', 'cat')
+        self.labeler.add_label('b.jpg', 'cat')
+        self.labeler.add_label('b.jpg', 'dog')
+        self.labeler.add_label('c.jpg', 'dog')
+        self.labeler.add_label('d.jpg', 'bird')
+
+    def test_query_MatchesIncludeAndExclude(self):
+        self._add_query_labels()
+
+        self.assertEqual(sorted(self.labeler.query(['cat'])), ['a.jpg', 'b.jpg'])
+        self.assertEqual(self.labeler.query(['cat'], ['dog']), ['a.jpg'])
+        self.assertEqual(self.labeler.query(['cat', 'dog']), ['b.jpg'])
+        self.assertEqual(sorted(self.labeler.query(exclude=['cat'])), ['c.jpg', 'd.jpg'])
+        self.assertEqual(self.labeler.query(['not a class']), [])
+
+    def test_query_ReflectsDeletedLabels(self):
+        self._add_query_labels()
+        self.labeler.delete_label('b.jpg', 'cat')
+
+        self.assertEqual(self.labeler.query(['cat']), ['a.jpg'])
+
+    def test_count_CountsMatches(self):
+        self._add_query_labels()
+
+        self.assertEqual(self.labeler.count(['dog']), 2)
+        self.assertEqual(self.labeler.count(['dog'], ['cat']), 1)
+        self.assertEqual(self.labeler.count(), 4)
+
+    def test_query_WithLoadedOnly_MatchesLoadedImages(self):
+        self._add_query_labels()
+        self.labeler.set_images(['a.jpg', 'b.jpg', 'e.jpg'])
+
+        self.assertEqual(self.labeler.query(['cat'], ['dog'], loaded_only=True), ['a.jpg'])
+        self.assertEqual(sorted(self.labeler.query(exclude=['dog'], loaded_only=True)), ['a.jpg', 'e.jpg'])
+        self.assertEqual(self.labeler.count(['dog'], loaded_only=True), 1)
+
+    def test_addImages_RemoveImages_UpdateLoadedImages(self):
+        self._add_query_labels()
+        self.labeler.set_images(['a.jpg'])
+        self.labeler.add_images(['c.jpg', 'e.jpg'])
+        self.labeler.remove_images(['a.jpg'])
+
+        self.assertEqual(sorted(self.labeler.query(loaded_only=True)), ['c.jpg', 'e.jpg'])
+
+    def test_countUnlabeled_CountsUnlabeled(self):
+        self._add_query_labels()
+        self.labeler.delete_label('d.jpg', 'bird')
+        self.labeler.set_images(['a.jpg', 'd.jpg', 'e.jpg'])
+
+        self.assertEqual(self.labeler.count_unlabeled(), 2)
+
+    def test_classCounts_CountsClasses(self):
+        self._add_query_labels()
+        self.labeler.add_class('fish')
+
+        self.assertEqual(self.labeler.class_counts(), {'cat': 2, 'dog': 2, 'bird': 1, 'fish': 0})
+
+    def test_cooccurrence_CountsPairs(self):
+        self._add_query_labels()
+
+        classes, matrix = self.labeler.cooccurrence()
+
+        self.assertEqual(classes, ['bird', 'cat', 'dog'])
+        self.assertEqual(matrix, [[1, 0, 0], [0, 2, 1], [0, 1, 2]])
+
     def test_addClass_AddsClass(self):
         test_class = 'test'
 
@@ -140,6 +216,75 @@ class LabelerTest(unittest.TestCase):
 
         self.assertEqual(self.labeler._classes, classes)
 
+    def test_undo_UndoesAddLabel(self):
+        self.labeler.add_label('foo.jpg', 'bar')
+
+        self.assertEqual(self.labeler.undo(), ['foo.jpg'])
+        self.assertEqual(self.labeler.get_labels('foo.jpg'), [])
+        self.assertEqual(self.labeler.get_classes(), set())
+        self.assertEqual(self.labeler.query(['bar']), [])
+
+    def test_undo_UndoesDeleteLabel(self):
+        self.labeler.add_label('foo.jpg', 'bar')
+        self.labeler.delete_label('foo.jpg', 'bar')
+
+        self.labeler.undo()
+
+        self.assertEqual(self.labeler.get_labels('foo.jpg'), ['bar'])
+        self.assertEqual(self.labeler.query(['bar']), ['foo.jpg'])
+
+    def test_undo_KeepsExistingClass(self):
+        self.labeler.add_class('bar')
+        self.labeler.add_label('foo.jpg', 'bar')
+
+        self.labeler.undo()
+
+        self.assertEqual(self.labeler.get_classes(), {'bar'})
+
+    def test_undo_UndoesGroupAddAtOnce(self):
+        self.labeler.add_label('foo.jpg', 'bar')
+        self.labeler.add_labels(['foo.jpg', 'foo1.jpg'], 'bar')
+
+        self.assertEqual(self.labeler.undo(), ['foo1.jpg'])
+        self.assertEqual(self.labeler.query(['bar']), ['foo.jpg'])
+
+    def test_undo_WithNoHistory_GetsNone(self):
+        self.assertIsNone(self.labeler.undo())
+        self.assertIsNone(self.labeler.redo())
+
+    def test_undo_ClassOnlyEdit_GetsEmptyList(self):
+        self.labeler.add_class('bar')
+
+        self.assertEqual(self.labeler.undo(), [])
+        self.assertEqual(self.labeler.get_classes(), set())
+
+    def test_undo_DropsOldestEditsPastHistoryLen(self):
+        labeler = Labeler(self.label_fname, history_len=2)
+
+        for label in ['foo', 'bar', 'baz']:
+            labeler.add_label('foo.jpg', label)
+
+        while labeler.undo() is not None:
+            pass
+
+        self.assertEqual(labeler.get_labels('foo.jpg'), ['foo'])
+
+    def test_redo_RedoesUndoneEdit(self):
+        self.labeler.add_label('foo.jpg', 'bar')
+        self.labeler.undo()
+
+        self.assertEqual(self.labeler.redo(), ['foo.jpg'])
+        self.assertEqual(self.labeler.get_labels('foo.jpg'), ['bar'])
+        self.assertEqual(self.labeler.get_classes(), {'bar'})
+
+    def test_redo_IsClearedByNewEdit(self):
+        self.labeler.add_label('foo.jpg', 'bar')
+        self.labeler.undo()
+        self.labeler.add_label('foo.jpg', 'baz')
+
+        self.assertIsNone(self.labeler.redo())
+        self.assertEqual(self.labeler.get_labels('foo.jpg'), ['baz'])
+
     def test_save_SavesLabels(self):
         fname = 'foo.jpg'
         labels = {'foo', 'bar'}
@@ -165,6 +310,41 @@ class LabelerTest(unittest.TestCase):
         self.assertEqual(labeler._labels, {fname: labels})
         self.assertEqual(labeler._classes, labels)
 
+    def test_init_IndexesExistingLabels(self):
+        self._add_query_labels()
+        self.labeler.save()
+
+        labeler = Labeler(self.label_fname)
+        self.assertEqual(labeler.query(['cat'], ['dog']), ['a.jpg'])
+        self.assertEqual(labeler.class_counts(), {'cat': 2, 'dog': 2, 'bird': 1})
+
+    def test_init_LoadsSnapshotWithAnyExtension(self):
+        fname = 'foo.jpg'
+        labels = {'foo', 'bar'}
+
+        self.labeler._labels = {fname: labels}
+        self.labeler._classes = set(labels)
+        self.labeler.save_snapshot(self.label_fname)
+
+        labeler = Labeler(self.label_fname)
+        self.assertEqual(labeler._labels, {fname: labels})
+        self.assertEqual(labeler._classes, labels)
+        self.assertEqual(labeler.query(['foo']), [fname])
+
+    def test_save_KeepsSnapshotFormat(self):
+        snapshot_fname = '/tmp/test-labels.jbl'
+        labeler = Labeler(snapshot_fname)
+        labeler.add_label('foo.jpg', 'bar')
+        labeler.save()
+
+        try:
+            self.assertEqual(Labeler(snapshot_fname).get_labels('foo.jpg'), ['bar'])
+
+            with open(snapshot_fname, 'rb') as f:
+                self.assertTrue(f.read().startswith(snapshot.MAGIC))
+        finally:
+            os.remove(snapshot_fname)
+
     def test_init_HandlesEmptyFilename(self):
         labeler = Labeler('')
         self.assertEqual(len(labeler._labels), 0)
@@ -178,3 +358,10 @@ class LabelerTest(unittest.TestCase):
 
         labeler = Labeler(bad_json_file)
         self.assertEqual(len(labeler._labels), 0)
+
+    def test_init_WithStrict_RaisesOnBadJson(self):
+        with open(self.label_fname, 'w') as f:
+            f.write('not JSON')
+
+        with self.assertRaises(ValueError):
+            Labeler(self.label_fname, strict=True)
@@ -0,0 +1,52 @@
+import os
+import unittest
+from PyQt5 import QtCore, QtGui
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from jabber.gui.review import FrameBuffer  # noqa: E402
+
+
+class FrameBufferTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+    def setUp(self):
+        self.fnames = [f'{i}.png' for i in range(20)]
+        self.frames = FrameBuffer(None, ahead=4, behind=2)
+        self.frames.reset(self.fnames, lambda fname: set(), QtCore.QSize(32, 32))
+
+    def _prefetch(self, idx, step):
+        self.frames.prefetch(idx, step)
+        self.frames._pool.waitForDone()
+        self.app.processEvents()
+
+    def _cached(self):
+        return {i for i, fname in enumerate(self.fnames) if self.frames.get(fname) is not None}
+
+    def test_keeps_window_around_cursor(self):
+        self._prefetch(10, 1)
+        self.assertEqual(self._cached(), set(range(8, 15)))
+
+        self._prefetch(11, 1)
+        self._prefetch(12, 1)
+        self.assertEqual(self._cached(), set(range(10, 17)))
+
+    def test_step_back_keeps_current(self):
+        for i in range(10, 13):
+            self._prefetch(i, 1)
+
+        self._prefetch(11, -1)
+        self.assertEqual(self._cached(), set(range(7, 14)))
+
+    def test_wanted(self):
+        self._prefetch(10, 1)
+        generation = self.frames._generation
+
+        self.assertTrue(self.frames.wanted(generation, 14))
+        self.assertFalse(self.frames.wanted(generation, 15))
+        self.assertTrue(self.frames.wanted(generation, 8))
+        self.assertFalse(self.frames.wanted(generation, 7))
+        self.assertFalse(self.frames.wanted(generation - 1, 10))
+
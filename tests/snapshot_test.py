@@ -0,0 +1,116 @@
+import io
+import os
+import unittest
+from jabber import snapshot
+from jabber.label import Labeler
+from jabber.migrate import migrate
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.json_fname = '/tmp/test-labels.json'
+        self.snapshot_fname = '/tmp/test-labels.jbl'
+
+    def tearDown(self):
+        for fname in [self.json_fname, self.snapshot_fname]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def test_read_ReadsWrittenLabels(self):
+        classes = {'foo', 'bar', 'baz', 'unused'}
+        labels = {'a.jpg': {'foo', 'bar'}, 'b.jpg': {'foo'}, 'c.jpg': set(), 'd.jpg': {'bar', 'foo'}}
+
+        f = io.BytesIO()
+        snapshot.write(f, classes, labels)
+        f.seek(0)
+        read_classes, read_labels, img_fnames, postings = snapshot.read(f)
+
+        self.assertEqual(read_classes, classes)
+        self.assertEqual(read_labels, labels)
+        self.assertEqual(img_fnames, list(labels))
+        self.assertEqual(postings, {'foo': 0b1011, 'bar': 0b1001, 'baz': 0, 'unused': 0})
+
+    def test_read_GivesEachImageItsOwnSet(self):
+        f = io.BytesIO()
+        snapshot.write(f, {'foo'}, {'a.jpg': {'foo'}, 'b.jpg': {'foo'}})
+        f.seek(0)
+        _, labels, _, _ = snapshot.read(f)
+
+        labels['a.jpg'].add('bar')
+        self.assertEqual(labels['b.jpg'], {'foo'})
+
+    def test_read_WithEmptyLabels_GetsEmpty(self):
+        f = io.BytesIO()
+        snapshot.write(f, set(), dict())
+        f.seek(0)
+
+        self.assertEqual(snapshot.read(f), (set(), dict(), list(), dict()))
+
+    def test_read_WithUnsupportedVersion_Raises(self):
+        f = io.BytesIO()
+        snapshot.write(f, {'foo'}, {'a.jpg': {'foo'}})
+        data = bytearray(f.getvalue())
+        data[len(snapshot.MAGIC)] = snapshot.VERSION + 1
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.read(io.BytesIO(bytes(data)))
+
+    def test_read_WithTruncatedSnapshot_Raises(self):
+        f = io.BytesIO()
+        snapshot.write(f, {'foo'}, {'a.jpg': {'foo'}})
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.read(io.BytesIO(f.getvalue()[:-3]))
+
+    def test_isSnapshot_DetectsFormatWithoutMoving(self):
+        f = io.BytesIO()
+        snapshot.write(f, set(), dict())
+        f.seek(0)
+
+        self.assertTrue(snapshot.is_snapshot(f))
+        self.assertEqual(f.tell(), 0)
+        self.assertFalse(snapshot.is_snapshot(io.BytesIO(b'{"a.jpg": []}')))
+
+    def test_migrate_RoundTripsJsonLayout(self):
+        layout = {'a.jpg': ['bar', 'foo'], 'b.jpg': ['foo'], 'c.jpg': []}
+
+        with open(self.json_fname, 'w') as f:
+            f.write('{"a.jpg": ["foo", "bar"], "b.jpg": ["foo"], "c.jpg": []}')
+
+        migrate(self.json_fname, self.snapshot_fname)
+        os.remove(self.json_fname)
+        migrate(self.snapshot_fname, self.json_fname)
+
+        labeler = Labeler(self.json_fname)
+        self.assertEqual({fname: sorted(labeler.get_labels(fname)) for fname in layout}, layout)
+
+    def test_migrate_WithMissingSource_Raises(self):
+        with self.assertRaises(FileNotFoundError):
+            migrate('/tmp/not-a-labels-file.json', self.snapshot_fname)
+
+    def test_migrate_WithCorruptSource_RaisesAndKeepsDestination(self):
+        with open(self.snapshot_fname, 'w') as f:
+            f.write('{"a.jpg": ["foo"]')
+
+        with open(self.json_fname, 'w') as f:
+            f.write('{"b.jpg": ["bar"]}')
+
+        with self.assertRaises(ValueError):
+            migrate(self.snapshot_fname, self.json_fname)
+
+        with open(self.json_fname, 'r') as f:
+            self.assertEqual(f.read(), '{"b.jpg": ["bar"]}')
+
+    def test_migrate_WithTruncatedSnapshot_Raises(self):
+        f = io.BytesIO()
+        snapshot.write(f, {'foo'}, {'a.jpg': {'foo'}})
+
+        with open(self.snapshot_fname, 'wb') as snapshot_file:
+            snapshot_file.write(f.getvalue()[:-3])
+
+        with self.assertRaises(snapshot.SnapshotError):
+            migrate(self.snapshot_fname, self.json_fname)
+
+        self.assertFalse(os.path.exists(self.json_fname))